@@ -1 +1,2 @@
-from . import psp2d
\ No newline at end of file
+from . import psp2d
+from .psp2d import ArraySpectra, Observations
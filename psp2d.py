@@ -11,25 +11,363 @@ Authors
 -------
 Joe Filippazzo, 2017-12-21
 """
+import copy
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import pysynphot as ps
 import matplotlib.pyplot as plt
 
+# Numba gives the fastest batched kernels but is optional; without it the
+# kernels fall back to NumPy, fusing the big element-wise expression with
+# numexpr when that is available
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
+
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
+
+if njit is not None:
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _countrate_batch(wave, flux2d, bp_wave, bp_thru, area):
+        """
+        Compute the count rate of every spectrum in the flux cube in one pass
+
+        This reproduces pysynphot's binned countrate on the shared wavelength
+        grid: the flux*throughput product is integrated over bins centered on
+        the wavelength values, with the bandpass interpolated onto the grid
+        once instead of once per spectrum
+
+        Parameters
+        ----------
+        wave: np.ndarray
+            The shared wavelength array (angstrom)
+        flux2d: np.ndarray
+            The (nspec, nwave) flux cube (photlam)
+        bp_wave: np.ndarray
+            The bandpass wavelength array
+        bp_thru: np.ndarray
+            The bandpass throughput array
+        area: float
+            The telescope collecting area in cm^2
+
+        Returns
+        -------
+        np.ndarray
+            The count rates, one per spectrum
+        """
+        nspec, nwave = flux2d.shape
+
+        # Bin edges with the wavelengths as the bin centers
+        edges = np.empty(nwave+1)
+        for i in range(1, nwave):
+            edges[i] = 0.5*(wave[i-1]+wave[i])
+        edges[0] = wave[0] - (edges[1]-wave[0])
+        edges[nwave] = wave[nwave-1] + (wave[nwave-1]-edges[nwave-1])
+
+        # Throughput at the bin centers and edges (shared by all spectra)
+        thru_c = np.interp(wave, bp_wave, bp_thru)
+        thru_e = np.interp(edges, bp_wave, bp_thru)
+
+        out = np.empty(nspec)
+        for j in prange(nspec):
+            total = 0.0
+            for i in range(nwave):
+                # Flux at the bin edges from the linear interpolant
+                if i == 0:
+                    fe_lo = flux2d[j, 0]
+                else:
+                    fe_lo = 0.5*(flux2d[j, i-1]+flux2d[j, i])
+                if i == nwave-1:
+                    fe_hi = flux2d[j, nwave-1]
+                else:
+                    fe_hi = 0.5*(flux2d[j, i]+flux2d[j, i+1])
+
+                # Trapezoid over the two half-bins
+                fc = flux2d[j, i]*thru_c[i]
+                total += 0.5*(fe_lo*thru_e[i] + fc)*(wave[i]-edges[i]) \
+                       + 0.5*(fc + fe_hi*thru_e[i+1])*(edges[i+1]-wave[i])
+            out[j] = total*area
+        return out
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _binflux_batch(wave, flux2d, bp_wave, bp_thru):
+        """
+        Bin the flux*throughput product of every spectrum in one pass
+
+        Same quadrature as `_countrate_batch`, but returning the average of
+        the product over each bin (pysynphot's binned flux in photlam)
+        rather than the overall sum
+
+        Parameters
+        ----------
+        wave: np.ndarray
+            The binned wavelength array, treated as bin centers (angstrom)
+        flux2d: np.ndarray
+            The (nspec, nwave) flux cube on that grid (photlam)
+        bp_wave: np.ndarray
+            The bandpass wavelength array
+        bp_thru: np.ndarray
+            The bandpass throughput array
+
+        Returns
+        -------
+        np.ndarray
+            The (nspec, nwave) binned fluxes
+        """
+        nspec, nwave = flux2d.shape
+
+        # Bin edges with the wavelengths as the bin centers
+        edges = np.empty(nwave+1)
+        for i in range(1, nwave):
+            edges[i] = 0.5*(wave[i-1]+wave[i])
+        edges[0] = wave[0] - (edges[1]-wave[0])
+        edges[nwave] = wave[nwave-1] + (wave[nwave-1]-edges[nwave-1])
+
+        # Throughput at the bin centers and edges (shared by all spectra)
+        thru_c = np.interp(wave, bp_wave, bp_thru)
+        thru_e = np.interp(edges, bp_wave, bp_thru)
+
+        out = np.empty((nspec, nwave))
+        for j in prange(nspec):
+            for i in range(nwave):
+                # Flux at the bin edges from the linear interpolant
+                if i == 0:
+                    fe_lo = flux2d[j, 0]
+                else:
+                    fe_lo = 0.5*(flux2d[j, i-1]+flux2d[j, i])
+                if i == nwave-1:
+                    fe_hi = flux2d[j, nwave-1]
+                else:
+                    fe_hi = 0.5*(flux2d[j, i]+flux2d[j, i+1])
+
+                # Trapezoid over the two half-bins, divided by the bin width
+                fc = flux2d[j, i]*thru_c[i]
+                out[j, i] = (0.5*(fe_lo*thru_e[i] + fc)*(wave[i]-edges[i])
+                           + 0.5*(fc + fe_hi*thru_e[i+1])*(edges[i+1]-wave[i])) \
+                          / (edges[i+1]-edges[i])
+        return out
+
+else:
+
+    def _bin_integrals(wave, flux2d, bp_wave, bp_thru):
+        """
+        Integrate the flux*throughput product over each bin without Numba
+
+        Same quadrature as the Numba kernels: bin edges centered on the
+        wavelengths, flux and throughput interpolated at the edges and a
+        trapezoid over each half-bin. The large element-wise expression is
+        fused with numexpr when it is installed
+
+        Parameters
+        ----------
+        wave: np.ndarray
+            The wavelength array, treated as bin centers (angstrom)
+        flux2d: np.ndarray
+            The (nspec, nwave) flux cube (photlam)
+        bp_wave: np.ndarray
+            The bandpass wavelength array
+        bp_thru: np.ndarray
+            The bandpass throughput array
+
+        Returns
+        -------
+        tuple
+            The (nspec, nwave) per-bin integrals and the (nwave,) bin widths
+        """
+        # Bin edges with the wavelengths as the bin centers
+        edges = np.empty(wave.size+1)
+        edges[1:-1] = 0.5*(wave[1:]+wave[:-1])
+        edges[0] = wave[0] - (edges[1]-wave[0])
+        edges[-1] = wave[-1] + (wave[-1]-edges[-2])
+
+        # Throughput at the bin centers and edges (shared by all spectra)
+        thru_c = np.interp(wave, bp_wave, bp_thru)
+        thru_e = np.interp(edges, bp_wave, bp_thru)
+
+        # Flux at the bin edges from the linear interpolant
+        fe = np.empty((flux2d.shape[0], wave.size+1), dtype=flux2d.dtype)
+        fe[:, 1:-1] = 0.5*(flux2d[:, 1:]+flux2d[:, :-1])
+        fe[:, 0] = flux2d[:, 0]
+        fe[:, -1] = flux2d[:, -1]
+
+        # Trapezoid over the two half-bins
+        fc = flux2d*thru_c
+        fe_lo, te_lo = fe[:, :-1], thru_e[:-1]
+        fe_hi, te_hi = fe[:, 1:], thru_e[1:]
+        dlo, dhi = wave-edges[:-1], edges[1:]-wave
+        if ne is not None:
+            integrals = ne.evaluate('0.5*((fe_lo*te_lo + fc)*dlo + (fc + fe_hi*te_hi)*dhi)')
+        else:
+            integrals = 0.5*((fe_lo*te_lo + fc)*dlo + (fc + fe_hi*te_hi)*dhi)
+        return integrals, edges[1:]-edges[:-1]
+
+    def _countrate_batch(wave, flux2d, bp_wave, bp_thru, area):
+        """
+        NumPy fallback for the Numba count-rate kernel
+
+        See `_bin_integrals` for the parameters; returns the count rates,
+        one per spectrum
+        """
+        integrals, _ = _bin_integrals(wave, flux2d, bp_wave, bp_thru)
+        return integrals.sum(axis=-1)*area
+
+    def _binflux_batch(wave, flux2d, bp_wave, bp_thru):
+        """
+        NumPy fallback for the Numba binned-flux kernel
+
+        See `_bin_integrals` for the parameters; returns the (nspec, nwave)
+        binned fluxes
+        """
+        integrals, widths = _bin_integrals(wave, flux2d, bp_wave, bp_thru)
+        return integrals/widths
+
+def _aligned_array(data, dtype=np.float64, align=64):
+    """
+    Copy data into a C-contiguous, 64-byte-aligned array
+
+    The constructor accepts any sequence, so the cube could end up
+    non-contiguous or misaligned, defeating auto-vectorization in the
+    NumPy ufunc inner loops and the Numba kernels. Allocating a padded
+    buffer and slicing to the alignment boundary guarantees aligned
+    SIMD loads
+
+    Parameters
+    ----------
+    data: sequence
+        The values to store
+    dtype: type
+        The dtype to store them in
+    align: int
+        The byte boundary to align the first element to
+
+    Returns
+    -------
+    np.ndarray
+        The aligned copy
+    """
+    data = np.asarray(data, dtype=dtype)
+    nbytes = data.size*data.itemsize
+    buf = np.empty(nbytes + align, dtype=np.uint8)
+    offset = (-buf.ctypes.data) % align
+    out = buf[offset:offset+nbytes].view(dtype).reshape(data.shape)
+    out[...] = data
+    return out
+
+def _stack(first, rest, n):
+    """
+    Stack n results into one array without the intermediate Python list
+
+    np.array([...]) builds a full list, then infers dtype/shape, then
+    copies; for shape-stable results the output can be preallocated and
+    filled in a single pass instead
+
+    Parameters
+    ----------
+    first: object
+        The first result, used to size and type the output
+    rest: iterator
+        The remaining n-1 results
+    n: int
+        The total number of results
+
+    Returns
+    -------
+    np.ndarray
+        The stacked results
+    """
+    if isinstance(first, np.ndarray):
+        out = np.empty((n,)+first.shape, dtype=first.dtype)
+    elif np.isscalar(first) and not isinstance(first, str):
+        out = np.empty(n, dtype=np.asarray(first).dtype)
+    else:
+        # Results without a stable shape/dtype (e.g. spectrum objects)
+        return np.array([first] + list(rest))
+
+    out[0] = first
+    for i, result in enumerate(rest, 1):
+        out[i] = result
+    return out
+
+class _LazySpectra(object):
+    """
+    A lazy sequence of 1D pysynphot objects
+
+    Building one pysynphot object per row of the flux cube is expensive,
+    so this proxy only constructs (and caches) a 1D object when it is
+    actually indexed
+    """
+    def __init__(self, factory, n):
+        """
+        Initialize the proxy
+
+        Parameters
+        ----------
+        factory: callable
+            A function that takes an index and returns the 1D object
+        n: int
+            The number of spectra in the cube
+        """
+        self._factory = functools.lru_cache(maxsize=None)(factory)
+        self._n = n
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._factory(i) for i in range(*idx.indices(self._n))]
+        if idx < 0:
+            idx += self._n
+        if not 0 <= idx < self._n:
+            raise IndexError('Index {} out of range for {} spectra'.format(idx, self._n))
+        return self._factory(idx)
+
+    def __iter__(self):
+        return map(self._factory, range(self._n))
+
+    def materialize(self):
+        """
+        Build and cache all the 1D objects at once
+
+        Construction is dominated by NumPy/C calls that release the GIL,
+        so the objects are built concurrently in a thread pool
+
+        Returns
+        -------
+        list
+            The 1D objects, in index order
+        """
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+            return list(ex.map(self._factory, range(self._n)))
+
 class ArraySpectra(object):
     """
     This is a wrapper class for pysynphot.ArraySpectrum() so it can handle ND spectra
     """
-    def __init__(self, wave, flux, **kwargs):
+    def __init__(self, wave, flux, dtype=np.float64, **kwargs):
         """
         Initialize the object
-        
+
         Parameters
         ----------
         wave: sequence
             The wavelength array
         flux:
             The flux cube
-        
+        dtype: type
+            The dtype to store the flux cube in; np.float32 halves the
+            memory traffic of the batched operations at the cost of
+            precision (sums are still accumulated in float64)
+
         Example
         -------
         import os
@@ -40,60 +378,268 @@ class ArraySpectra(object):
         model['wave'] *= 10000
         spec2D = pysynphot2d.psp2d.ArraySpectra(**model)
         """
-        # Create object for each 1D spectrum
-        self.spectra = [ps.ArraySpectrum(wave, f, name=n) for n,f in enumerate(flux)]
-        
+        # Store the shared wavelength array once and the flux cube whole,
+        # rather than paying for N ps.ArraySpectrum constructions up front
+        self._wave = _aligned_array(wave)
+        self._flux = _aligned_array(flux, dtype=dtype)
+
+        # Zero negative fluxes across the whole cube up front, as pysynphot
+        # would for each 1D spectrum at construction, so the batched paths
+        # and the lazily built spectra always see the same data
+        neg = self._flux < 0
+        if neg.any():
+            self._flux[neg] = 0.0
+            print("Warning, %d of %d bins contained negative fluxes; they "
+                  "have been set to zero." % (neg.sum(), self._flux.size))
+        self._names = np.arange(len(self._flux))
+        self._waveunits = 'angstrom'
+        self._fluxunits = 'photlam'
+
+        # One fully constructed prototype amortizes the per-spectrum
+        # constructor cost; the lazy factory swaps its flux table instead
+        # of building each spectrum from scratch
+        self._proto = ps.ArraySpectrum(self._wave, self._flux[0], name=0) if len(self._flux) else None
+
+        # Create the 1D spectra on demand instead
+        self.spectra = _LazySpectra(self._make_spectrum, len(self._flux))
+
+        # Per-attribute caches of bound methods for the fallback loop
+        self._specialized = {}
+
         # Store other inputs as attributes
         for key, value in kwargs.items():
             setattr(self, key, value)
-            
-    def __getattribute__(self, attr):
+
+    def _make_spectrum(self, idx):
         """
-        Redefining the getattribute call to iterate over the list of 1D spectra
-        
+        Build the 1D spectrum for the given index
+
+        Parameters
+        ----------
+        idx: int
+            The index of the spectrum
+
+        Returns
+        -------
+        ps.ArraySpectrum
+            The 1D spectrum
+        """
+        # Negative fluxes were zeroed cube-wide at construction, so every
+        # row can reuse the prototype with just the flux table swapped out
+        if self._proto is not None:
+            spec = copy.copy(self._proto)
+            spec._fluxtable = self._flux[idx]
+            spec.name = idx
+            spec.warnings = {}
+        else:
+            spec = ps.ArraySpectrum(self._wave, self._flux[idx], name=idx)
+
+        spec.convert(self._waveunits)
+        spec.convert(self._fluxunits)
+        return spec
+
+    # Cube-wide arrays served directly instead of iterating the spectra
+    _SHARED = {'name':'_names', 'waveunits':'_waveunits', 'fluxunits':'_fluxunits'}
+
+    # Memoized attribute kinds ('method' or 'data') of the 1D spectra
+    _ATTR_KIND = {}
+
+    def __getattr__(self, attr):
+        """
+        Fall back to the 1D spectra for attributes this object lacks
+
+        Only invoked when normal attribute lookup misses, so access to the
+        object's own attributes pays no dispatch cost
+
         Parameters
         ----------
         attr: str
             The attribute to call
-        
+
         Returns
         -------
         np.ndarray
             An array of the results
         """
-        # Try to get the attribute from the parent object
-        try:
-            return super().__getattribute__(attr)
-            
-        # If that fails, check the child object
-        except AttributeError:
-            
-            # If it is a method...
-            if callable(getattr(self.spectra[0], attr)):
-                results = lambda *args, **kwargs: self._vec_attr(attr, *args, **kwargs)
-                
-            # ... or just an attribute
-            else:
-                results = np.array([getattr(data1D, attr) for data1D in self.spectra])
-            
-        return results
-                
+        # Never forward private attributes, to avoid recursing before
+        # __init__ has populated the instance
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+
+        cls = type(self)
+
+        # Convert the cube-wide arrays from internal units in one broadcast
+        if attr == 'wave':
+            if self._waveunits == 'angstrom':
+                return self._wave
+            return ps.units.Angstrom().Convert(self._wave, self._waveunits)
+        if attr == 'flux':
+            if self._fluxunits == 'photlam':
+                return self._flux
+            return ps.units.Photlam().Convert(self._wave, self._flux, self._fluxunits)
+
+        # Short-circuit the other cube-wide values
+        if attr in cls._SHARED:
+            return getattr(self, cls._SHARED[attr])
+
+        # Probe the first 1D spectrum once and remember the attribute kind
+        kind = cls._ATTR_KIND.get(attr)
+        if kind is None:
+            kind = 'method' if callable(getattr(self.spectra[0], attr)) else 'data'
+            cls._ATTR_KIND[attr] = kind
+
+        # If it is a method...
+        if kind == 'method':
+            return functools.partial(self._vec_attr, attr)
+
+        # ... or just an attribute
+        spectra = self.spectra
+        results = (getattr(data1D, attr) for data1D in spectra)
+        return _stack(next(results), results, len(spectra))
+
     def _vec_attr(self, attr, *args, **kwargs):
         """
         Iterate over the 1D spectra
-        
+
         Parameters
         ----------
         attr: str
             The attribute to call
-        
+
         Returns
         -------
         np.ndarray
             The vectorized results
         """
-        return np.array([getattr(data1D, attr)(*args, **kwargs) for data1D in self.spectra])
-        
+        # Methods with a batched implementation run once on the whole cube
+        batch = type(self)._BATCHABLE.get(attr)
+        if batch is not None:
+            return batch(self, *args, **kwargs)
+
+        methods = self._specialize(attr)
+        results = (method(*args, **kwargs) for method in methods)
+        return _stack(next(results), results, len(methods))
+
+    def _specialize(self, attr):
+        """
+        Capture the bound methods for the given attribute, once
+
+        Repeated vectorized calls to the same method re-did a string-keyed
+        getattr on each of the N spectra every time; caching the bound
+        methods turns those into direct calls
+
+        Parameters
+        ----------
+        attr: str
+            The attribute to capture
+
+        Returns
+        -------
+        list
+            The bound methods, one per spectrum
+        """
+        methods = self._specialized.get(attr)
+        if methods is None:
+            methods = [getattr(data1D, attr) for data1D in self.spectra]
+            self._specialized[attr] = methods
+        return methods
+
+    def _batch_sample(self, wave):
+        """
+        Sample all the spectra at the given wavelength(s) in one pass
+
+        Parameters
+        ----------
+        wave: float, sequence
+            The wavelength(s) to sample, in the current wave units
+
+        Returns
+        -------
+        np.ndarray
+            The sampled fluxes, one row per spectrum
+        """
+        # Interpolate in internal units (angstrom, photlam), as pysynphot does
+        angwave = ps.units.Units(self._waveunits).ToAngstrom(wave)
+        idx = np.clip(np.searchsorted(self._wave, angwave), 1, self._wave.size-1)
+        w0, w1 = self._wave[idx-1], self._wave[idx]
+        frac = np.clip((angwave-w0)/(w1-w0), 0, 1)
+        flux = self._flux[..., idx-1]*(1-frac) + self._flux[..., idx]*frac
+
+        # Then convert to the current flux units
+        return ps.units.Photlam().Convert(angwave, flux, self._fluxunits)
+
+    def _batch_integrate(self, fluxunits='photlam'):
+        """
+        Integrate all the spectra in one pass
+
+        Parameters
+        ----------
+        fluxunits: str
+            The flux units to integrate in
+
+        Returns
+        -------
+        np.ndarray
+            The integrated fluxes
+        """
+        wave = ps.units.Angstrom().Convert(self._wave, self._waveunits)
+        flux = ps.units.Photlam().Convert(self._wave, self._flux, fluxunits)
+        return self._batch_trapz(wave, flux)
+
+    def _batch_convert(self, targetunits):
+        """
+        Set new user units for every spectrum at once
+
+        Like pysynphot, the data are kept in internal units (angstrom and
+        photlam) and only converted on access, so this is a single unit
+        relabel for the whole cube instead of N per-spectrum calls; the
+        actual conversion happens as one broadcast when .wave or .flux
+        is read
+
+        Parameters
+        ----------
+        targetunits: str
+            The new wavelength or flux unit name
+        """
+        nunits = ps.units.Units(targetunits)
+
+        if nunits.isFlux:
+            self._fluxunits = nunits.name
+        else:
+            self._waveunits = nunits.name
+
+        # Forget any cached 1D spectra and bound methods built with the
+        # old user units
+        self.spectra = _LazySpectra(self._make_spectrum, len(self._flux))
+        self._specialized = {}
+
+    def _batch_trapz(self, x, y):
+        """
+        Trapezoidal integration of a stack of integrands in one pass
+
+        Parameters
+        ----------
+        x: sequence
+            The wavelength set
+        y: sequence
+            The integrand(s), batched along the leading axis
+
+        Returns
+        -------
+        float or np.ndarray
+            The integrated sum(s)
+        """
+        result = np.trapz(y, x, axis=-1)
+        if x[-1] < x[0]:
+            result = -result
+        return result
+
+    # Methods applied once to the stacked flux array instead of per-spectrum
+    _BATCHABLE = {'sample': _batch_sample,
+                  'integrate': _batch_integrate,
+                  'convert': _batch_convert,
+                  'trapezoidIntegration': _batch_trapz}
+
     def plot(self, idx, param=''):
         """
         Plot the spectrum
@@ -105,15 +651,18 @@ class ArraySpectra(object):
         param: str
             The name of the parameter to print
         """
-        obs = self.spectra[idx]
+        # Read straight from the stored arrays; no need to build the
+        # 1D pysynphot object just to plot it
+        name = self._names[idx]
+        wave, flux = self.wave, self.flux[idx]
         if param:
             p = getattr(self, param)
-            plt.plot(obs.wave, obs.flux, label='{} @ {} = {}'.format(obs.name,param,p[idx]))
+            plt.plot(wave, flux, label='{} @ {} = {}'.format(name,param,p[idx]))
         else:
-            plt.plot(obs.wave, obs.flux, label=obs.name)
-            
-        plt.xlabel(obs.waveunits)
-        plt.ylabel(obs.fluxunits)
+            plt.plot(wave, flux, label=name)
+
+        plt.xlabel(self._waveunits)
+        plt.ylabel(self._fluxunits)
         plt.legend(loc=0)
         
 class Observations(object):
@@ -144,43 +693,104 @@ class Observations(object):
         bp = pysynphot.ObsBandpass('wfc3,ir,g141')
         obs = pysynphot2d.psp2d.Observations(spec2D, bp)
         """
-        # Create object for each 1D spectrum
-        self.spectra = [ps.Observation(spec, band) for spec in spec2D.spectra]
-        
+        # Every spectrum shares the same wavelength grid, so resample the
+        # bandpass onto it exactly once instead of once per spectrum
+        self._spec2D = spec2D
+        self._band = band
+        self._wave = spec2D._wave
+        self._flux = spec2D._flux
+        self._bp_wave = np.ascontiguousarray(band.wave, dtype=np.float64)
+        self._bp_thru = np.ascontiguousarray(band.throughput, dtype=np.float64)
+        self._thru = np.interp(self._wave, self._bp_wave, self._bp_thru)
+        self._area = ps.refs.PRIMARY_AREA
+
+        # Check the spectrum/bandpass overlap once; it is the same for all rows
+        _, _, self.warnings = ps.observation.validate_overlap(spec2D.spectra[0], band, None)
+
+        # Precompute the binned grid (bandpass-derived, so it is shared by
+        # every spectrum) and the binned fluxes for the whole cube at once
+        try:
+            self._binwave = band.binset
+        except (KeyError, AttributeError):
+            self._binwave = None
+        if self._binwave is None:
+            self._binwave = self._wave
+            self._binflux = _binflux_batch(self._wave, self._flux, self._bp_wave, self._bp_thru)
+        else:
+            self._binwave = np.ascontiguousarray(self._binwave, dtype=np.float64)
+            idx = np.clip(np.searchsorted(self._wave, self._binwave), 1, self._wave.size-1)
+            w0, w1 = self._wave[idx-1], self._wave[idx]
+            frac = np.clip((self._binwave-w0)/(w1-w0), 0, 1)
+            binned = self._flux[..., idx-1]*(1-frac) + self._flux[..., idx]*frac
+            self._binflux = _binflux_batch(self._binwave, binned, self._bp_wave, self._bp_thru)
+
+        # Create the 1D observations on demand instead of eagerly
+        self.spectra = _LazySpectra(self._make_observation, len(self._flux))
+
+        # Per-attribute caches of bound methods for the fallback loop
+        self._specialized = {}
+
         # Store other inputs as attributes
         for key, value in kwargs.items():
             setattr(self, key, value)
+
+    def _make_observation(self, idx):
+        """
+        Build the 1D observation for the given index
+
+        Parameters
+        ----------
+        idx: int
+            The index of the observation
+
+        Returns
+        -------
+        ps.Observation
+            The 1D observation
+        """
+        return ps.Observation(self._spec2D.spectra[idx], self._band)
             
-    def __getattribute__(self, attr):
+    # Memoized attribute kinds ('method' or 'data') of the 1D observations
+    _ATTR_KIND = {}
+
+    def __getattr__(self, attr):
         """
-        Redefining the getattribute call to iterate over the list of 1D spectra
-        
+        Fall back to the 1D observations for attributes this object lacks
+
+        Only invoked when normal attribute lookup misses, so access to the
+        object's own attributes pays no dispatch cost
+
         Parameters
         ----------
         attr: str
             The attribute to call
-        
+
         Returns
         -------
         np.ndarray
             An array of the results
         """
-        # Try to get the attribute from the parent object
-        try:
-            return super().__getattribute__(attr)
-            
-        # If that fails, check the child object
-        except AttributeError:
-            
-            # If it is a method...
-            if callable(getattr(self.spectra[0], attr)):
-                results = lambda *args, **kwargs: self._vec_attr(attr, *args, **kwargs)
-                
-            # ... or just an attribute
-            else:
-                results = np.array([getattr(data1D, attr) for data1D in self.spectra])
-            
-        return results
+        # Never forward private attributes, to avoid recursing before
+        # __init__ has populated the instance
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+
+        cls = type(self)
+
+        # Probe the first 1D observation once and remember the attribute kind
+        kind = cls._ATTR_KIND.get(attr)
+        if kind is None:
+            kind = 'method' if callable(getattr(self.spectra[0], attr)) else 'data'
+            cls._ATTR_KIND[attr] = kind
+
+        # If it is a method...
+        if kind == 'method':
+            return functools.partial(self._vec_attr, attr)
+
+        # ... or just an attribute
+        spectra = self.spectra
+        results = (getattr(data1D, attr) for data1D in spectra)
+        return _stack(next(results), results, len(spectra))
                 
     def _vec_attr(self, attr, *args, **kwargs):
         """
@@ -196,8 +806,157 @@ class Observations(object):
         np.ndarray
             The vectorized results
         """
-        return np.array([getattr(data1D, attr)(*args, **kwargs) for data1D in self.spectra])
-        
+        # Methods with a batched implementation run once on the whole cube
+        batch = type(self)._BATCHABLE.get(attr)
+        if batch is not None:
+            return batch(self, *args, **kwargs)
+
+        methods = self._specialize(attr)
+        results = (method(*args, **kwargs) for method in methods)
+        return _stack(next(results), results, len(methods))
+
+    def _specialize(self, attr):
+        """
+        Capture the bound methods for the given attribute, once
+
+        Repeated vectorized calls to the same method re-did a string-keyed
+        getattr on each of the N spectra every time; caching the bound
+        methods turns those into direct calls
+
+        Parameters
+        ----------
+        attr: str
+            The attribute to capture
+
+        Returns
+        -------
+        list
+            The bound methods, one per spectrum
+        """
+        methods = self._specialized.get(attr)
+        if methods is None:
+            methods = [getattr(data1D, attr) for data1D in self.spectra]
+            self._specialized[attr] = methods
+        return methods
+
+    def countrate(self, binned=True, range=None, force=False):
+        """
+        Calculate the count rate of every observation in one pass
+
+        As an explicit method this also skips the __getattr__ dispatch
+        machinery entirely for callers in hot loops
+
+        Parameters
+        ----------
+        binned: bool
+            Use binned data
+        range: tuple
+            The wavelength range to integrate over
+        force: bool
+            Allow a partially overlapping range
+
+        Returns
+        -------
+        np.ndarray
+            The count rates
+        """
+        # The kernel covers the default full-range binned case only
+        if not binned or range is not None:
+            return np.array([data1D.countrate(binned=binned, range=range, force=force) for data1D in self.spectra])
+
+        return _countrate_batch(self._wave, self._flux, self._bp_wave, self._bp_thru, self._area)
+
+    def effstim(self, fluxunits='photlam'):
+        """
+        Compute the effective stimulus of every observation in one pass
+
+        Parameters
+        ----------
+        fluxunits: str
+            The flux units of the result
+
+        Returns
+        -------
+        np.ndarray
+            The effective stimuli
+        """
+        x = ps.units.Units(fluxunits)
+        product = self._flux*self._thru
+
+        # Density units scale the photlam integral by the band's unit
+        # response; counts and obmag sum the native flux in counts
+        if x.isDensity:
+            rate = np.trapz(product, self._wave, axis=-1)
+            self._fluxcheck(rate)
+            if x.isMag:
+                ans = x.unitResponse(self._band) - 2.5*np.log10(rate)
+            else:
+                ans = rate*x.unitResponse(self._band)
+        else:
+            widths = np.empty_like(self._wave)
+            widths[1:-1] = 0.5*(self._wave[2:]-self._wave[:-2])
+            widths[0] = self._wave[1]-self._wave[0]
+            widths[-1] = self._wave[-1]-self._wave[-2]
+            total = (product*widths).sum(axis=-1)*self._area
+            self._fluxcheck(total)
+            if x.isMag:
+                ans = -2.5*np.log10(total)
+            else:
+                ans = total
+
+        return ans
+
+    def _fluxcheck(self, totalflux):
+        """
+        Raise if any of the integrated fluxes is invalid
+
+        Parameters
+        ----------
+        totalflux: np.ndarray
+            The integrated fluxes
+        """
+        if (totalflux <= 0.0).any():
+            raise ValueError('Integrated flux is <= 0')
+        if np.isnan(totalflux).any():
+            raise ValueError('Integrated flux is NaN')
+        if np.isinf(totalflux).any():
+            raise ValueError('Integrated flux is infinite')
+
+    def pivot(self, binned=True):
+        """
+        Calculate the pivot wavelength of every observation in one pass
+
+        Parameters
+        ----------
+        binned: bool
+            Use the binned wavelength set
+
+        Returns
+        -------
+        np.ndarray
+            The pivot wavelengths
+        """
+        wave = self._binwave if binned else self._wave
+        product = self._flux*self._thru
+        if wave is not self._wave:
+            idx = np.clip(np.searchsorted(self._wave, wave), 1, self._wave.size-1)
+            w0, w1 = self._wave[idx-1], self._wave[idx]
+            frac = np.clip((wave-w0)/(w1-w0), 0, 1)
+            product = product[..., idx-1]*(1-frac) + product[..., idx]*frac
+
+        num = np.trapz(product*wave, wave, axis=-1)
+        den = np.trapz(product/wave, wave, axis=-1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ans = np.sqrt(num/den)
+        ans[(num == 0.0) | (den == 0.0)] = 0.0
+        return ans
+
+    # Methods applied once to the stacked flux array instead of per-spectrum
+    _BATCHABLE = {'countrate': countrate,
+                  'effstim': effstim,
+                  'pivot': pivot}
+
     def plot(self, idx):
         """
         Plot the observation
@@ -207,9 +966,23 @@ class Observations(object):
         idx: int
             The index of the spectrum to plot
         """
-        obs = self.spectra[idx]
-        plt.plot(obs.wave, obs.flux, label='native, {}'.format(obs.name))
-        plt.step(obs.binwave, obs.binflux, label='binned, {}'.format(obs.name))
-        plt.xlabel(obs.waveunits)
-        plt.ylabel(obs.fluxunits)
+        # Read straight from the stored arrays; no need to build the
+        # 1D pysynphot object just to plot it. The arrays are in internal
+        # units, so convert them to the user units shown on the axes
+        waveunits = self._spec2D._waveunits
+        fluxunits = self._spec2D._fluxunits
+        wave, binwave = self._wave, self._binwave
+        flux = self._flux[idx]*self._thru
+        binflux = self._binflux[idx]
+        if waveunits != 'angstrom':
+            wave = ps.units.Angstrom().Convert(wave, waveunits)
+            binwave = ps.units.Angstrom().Convert(binwave, waveunits)
+        if fluxunits != 'photlam':
+            flux = ps.units.Photlam().Convert(self._wave, flux, fluxunits)
+            binflux = ps.units.Photlam().Convert(self._binwave, binflux, fluxunits)
+
+        plt.plot(wave, flux, label='native, {}'.format(idx))
+        plt.step(binwave, binflux, label='binned, {}'.format(idx))
+        plt.xlabel(waveunits)
+        plt.ylabel(fluxunits)
         plt.legend(loc=0)
\ No newline at end of file